@@ -13,60 +13,455 @@
 #    * See the License for the specific language governing permissions and
 #    * limitations under the License.
 
+import atexit
 import errno
+import json
 import logging
+import multiprocessing
 import os
+import Queue
+import shutil
+import signal
 import subprocess
+import tempfile
+import threading
+import time
 from contextlib import contextmanager
+from multiprocessing.pool import ThreadPool
 
 import click
-import yaml
 
 from . import get_plugin_name_from_repo
+from .cache import CACHE_DIR_ENV
+from .catalog import CATALOG_FILE, CATALOG_URL_ENV, build_catalog
+from .deploy import (
+    DEPLOYED_MANIFEST,
+    diff_files,
+    load_files,
+    save_files,
+    update_files,
+    write_archive,
+    write_list,
+    )
+from .linkcheck import check_links
+
+
+STATE_FILE = 'sphinxify-state.json'
+MANIFEST_FILE = 'sphinxify-manifest.json'
+
+# A year, in seconds
+WAIT_FOREVER = 365 * 24 * 60 * 60
+
+
+class CommandTimeout(Exception):
+    pass
+
+
+class Aborted(Exception):
+    pass
+
+
+# Every command & worker runs in its own process group, so they don't get
+# the terminal's signals. Their groups are tracked here, so everything can be
+# killed when sphinxify-build is interrupted.
+process_groups = set()
+process_lock = threading.Lock()
+aborted = threading.Event()
+
+
+def kill_group(pid):
+    try:
+        os.killpg(pid, signal.SIGKILL)
+    except OSError:
+        # Not its own group leader (yet)
+        try:
+            os.kill(pid, signal.SIGKILL)
+        except OSError:
+            pass
+
+
+def abort_all():
+    """
+    Kill every running command & worker, and don't start any more
+    """
+    with process_lock:
+        aborted.set()
+        for pid in list(process_groups):
+            kill_group(pid)
+
+
+def load_state(build_dir):
+    """
+    Load the results recorded by the previous run in `build_dir`
+    """
+    try:
+        with open(os.path.join(build_dir, STATE_FILE)) as f:
+            state = json.load(f)
+    except IOError as e:
+        if e.errno != errno.ENOENT:
+            raise
+        state = {}
+    state.setdefault('durations', {})
+    state.setdefault('failures', [])
+    return state
+
+
+def save_state(build_dir, state):
+    path = os.path.join(build_dir, STATE_FILE)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(state, f, indent=2, sort_keys=True)
+    os.rename(path + '.tmp', path)
+
+
+def run(cmd, cwd=None, timeout=None, env=None):
+    """
+    `subprocess.check_call` with a timeout (in seconds).
+    """
+    with process_lock:
+        if aborted.is_set():
+            raise Aborted()
+        # Own process group, so a timed out command can be killed together
+        # with its children (sphinx-versioning forks a sphinx-build for each
+        # ref)
+        proc = subprocess.Popen(cmd, cwd=cwd, env=env, preexec_fn=os.setsid)
+        process_groups.add(proc.pid)
+    timed_out = []
+
+    def kill():
+        timed_out.append(True)
+        kill_group(proc.pid)
+
+    timer = None
+    if timeout:
+        timer = threading.Timer(timeout, kill)
+        timer.start()
+    try:
+        returncode = proc.wait()
+    finally:
+        if timer is not None:
+            timer.cancel()
+        process_groups.discard(proc.pid)
+
+    if timed_out:
+        raise CommandTimeout(
+            '{} timed out after {}s'.format(' '.join(cmd), timeout))
+    if returncode:
+        raise subprocess.CalledProcessError(returncode, cmd)
+
+
+def run_in_process(cmd, cwd, env):
+    """
+    Run `sphinx-versioning` inside this interpreter, keeping the process
+    state it changes (working dir, environment, logging) isolated.
+    """
+    from sphinxcontrib.versioning.__main__ import cli
+
+    prevdir = os.getcwd()
+    prevenv = dict(os.environ)
+    root_logger = logging.getLogger()
+    handlers = list(root_logger.handlers)
+    level = root_logger.level
+    exithandlers = list(atexit._exithandlers)
+    try:
+        os.chdir(cwd)
+        os.environ.clear()
+        os.environ.update(env)
+        cli.main(args=cmd[1:], prog_name=cmd[0], standalone_mode=False)
+    except (Exception, SystemExit) as e:
+        if isinstance(e, SystemExit) and not e.code:
+            return None
+        logging.error('{} failed: {!r}'.format(' '.join(cmd), e))
+        return 1
+    finally:
+        # sphinx-versioning removes its temporary dirs (an export of every
+        # ref) at exit, which a worker never gets to
+        run_exit_handlers(exithandlers)
+        # sphinx-versioning adds its log handlers every time it runs
+        root_logger.handlers[:] = handlers
+        root_logger.setLevel(level)
+        os.environ.clear()
+        os.environ.update(prevenv)
+        os.chdir(prevdir)
+
+
+def run_exit_handlers(previous):
+    """
+    Run (and unregister) the `atexit` handlers registered since `previous`
+    was copied from `atexit._exithandlers`
+    """
+    new = [
+        handler for handler in atexit._exithandlers
+        if handler not in previous
+        ]
+    atexit._exithandlers[:] = previous
+    for func, args, kwargs in reversed(new):
+        try:
+            func(*args, **kwargs)
+        except Exception as e:
+            logging.warning('Exit handler {!r} failed: {}'.format(func, e))
+
+
+def worker_main(conn, tempdir):
+    # Own process group, so a timed out build can be killed together with
+    # the processes sphinx-versioning forks for each ref
+    os.setsid()
+
+    # Removed by the parent when the worker stops, even if it was killed
+    tempfile.tempdir = tempdir
+
+    # Warm up once: everything imported or loaded here is inherited by the
+    # builds (sphinx-versioning forks a child for each one)
+    import sphinx.application  # noqa
+    import sphinxcontrib.versioning.__main__  # noqa
+    from .extension import get_cloudify_versions
+    get_cloudify_versions()
+
+    while True:
+        try:
+            task = conn.recv()
+        except EOFError:
+            return
+        if task is None:
+            return
+        conn.send(run_in_process(*task))
 
 
 @contextmanager
-def pushd(newdir):
+def logging_locked():
     """
-    Context Manager for temporarily moving to a new directory.
-    Has stack-like behaviour for nested contexts.
-    Named after shell `pushd`/`popd` commands.
+    Hold every logging lock.
+
+    Python 2 doesn't reset them in a forked child, so forking while another
+    thread is logging leaves the child deadlocked the first time it logs.
+    """
+    handlers = [ref() for ref in logging._handlerList]
+    handlers = [handler for handler in handlers if handler is not None]
+    logging._acquireLock()
+    try:
+        for handler in handlers:
+            handler.acquire()
+        try:
+            yield
+        finally:
+            for handler in reversed(handlers):
+                handler.release()
+    finally:
+        logging._releaseLock()
+
+
+class BuildWorker(object):
+    """
+    A warm interpreter which runs `sphinx-versioning` builds in-process,
+    one at a time, instead of starting a new interpreter for each.
     """
-    prevdir = os.path.abspath(os.getcwd())
-    os.chdir(newdir)
-    yield
-    os.chdir(prevdir)
 
+    def __init__(self):
+        self.process = None
+        self.conn = None
+        self.tempdir = None
+
+    def start(self):
+        self.conn, child_conn = multiprocessing.Pipe()
+        self.tempdir = tempfile.mkdtemp(prefix='sphinxify-worker-')
+        # Not daemonic: sphinx-versioning needs to start its own children
+        self.process = multiprocessing.Process(
+            target=worker_main, args=(child_conn, self.tempdir))
+        with process_lock:
+            if aborted.is_set():
+                raise Aborted()
+            # Workers are restarted from the build threads
+            with logging_locked():
+                self.process.start()
+            process_groups.add(self.process.pid)
+        child_conn.close()
+
+    def stop(self, kill=False):
+        # May be called by the main thread while a build thread uses the
+        # worker, when sphinxify-build is interrupted
+        process, conn, tempdir = self.process, self.conn, self.tempdir
+        if process is None:
+            return
+        self.process = self.conn = self.tempdir = None
+        if kill:
+            kill_group(process.pid)
+        else:
+            try:
+                conn.send(None)
+            except IOError:
+                pass
+        process.join()
+        process_groups.discard(process.pid)
+        conn.close()
+        shutil.rmtree(tempdir, ignore_errors=True)
+
+    def run(self, cmd, cwd=None, timeout=None, env=None):
+        """
+        Same interface as `run`.
+        """
+        if self.process is None or not self.process.is_alive():
+            self.stop(kill=True)
+            self.start()
+
+        self.conn.send((cmd, cwd, env or dict(os.environ)))
+        if not self.conn.poll(timeout):
+            self.stop(kill=True)
+            raise CommandTimeout(
+                '{} timed out after {}s'.format(' '.join(cmd), timeout))
+        try:
+            returncode = self.conn.recv()
+        except EOFError:
+            # The worker died
+            self.stop(kill=True)
+            returncode = -1
+        if returncode:
+            raise subprocess.CalledProcessError(returncode, cmd)
 
-def build_component(name, component, out_dir):
+
+def retry(func, retries=0, backoff=1, cleanup=None):
+    """
+    Call `func`, retrying up to `retries` times with exponential backoff.
+    `cleanup` is called before each retry.
+    """
+    for attempt in range(retries + 1):
+        try:
+            return func()
+        except (subprocess.CalledProcessError, CommandTimeout) as e:
+            if attempt == retries or aborted.is_set():
+                raise
+            delay = backoff * 2 ** attempt
+            logging.warning('{} (retrying in {}s)'.format(e, delay))
+            # Cut short if sphinxify-build is interrupted
+            if aborted.wait(delay):
+                raise Aborted()
+            if cleanup is not None:
+                cleanup()
+
+
+def build_component(name, component, build_dir, out_dir,
+                    clone_timeout=None, build_timeout=None,
+                    retries=0, backoff=1, cache=True, worker=None):
     dirname = get_plugin_name_from_repo(name)
+    repo_dir = os.path.join(build_dir, dirname)
+
+    env = dict(os.environ)
+    # Each component is built into a dir next to the catalog
+    env[CATALOG_URL_ENV] = '../' + CATALOG_FILE
+    if cache:
+        # Picked up by the extension inside each Sphinx build
+        env[CACHE_DIR_ENV] = os.path.join(build_dir, 'cache', dirname)
+
+    def remove_clone():
+        shutil.rmtree(repo_dir, ignore_errors=True)
 
-    if not os.path.isdir(dirname):
-        subprocess.check_call([
-            'git', 'clone',
-            component['repo'],
-            dirname,
-            ])
+    if not os.path.isdir(repo_dir):
+        retry(
+            lambda: run([
+                'git', 'clone',
+                component['repo'],
+                repo_dir,
+                ], timeout=clone_timeout),
+            retries, backoff,
+            cleanup=remove_clone,
+            )
 
     # There's no need to fetch or pull anything because SCV always builds
     # branches & tags straight from the remote
 
-    with pushd(os.path.join(dirname)):
-        print('build dir ', os.getcwd())
-        subprocess.check_call([
-                'sphinx-versioning',
-                'build', 'docs', os.path.join(out_dir, dirname),
-                '--root-ref', component['branch'],
-                '--banner-main-ref', component['branch'],
-                '--show-banner',
-                ])
+    print('build dir ', repo_dir)
+    retry(
+        lambda: (worker.run if worker else run)([
+            'sphinx-versioning',
+            'build', 'docs', os.path.join(out_dir, dirname),
+            '--root-ref', component['branch'],
+            '--banner-main-ref', component['branch'],
+            '--show-banner',
+            ], cwd=repo_dir, timeout=build_timeout, env=env),
+        retries, backoff,
+        )
+
+
+def schedule(names, durations):
+    """
+    Order components longest-first by their previously recorded build
+    duration, so the slowest ones don't end up on the critical path.
+    Components without a recorded duration go first.
+    """
+    return sorted(
+        names,
+        key=lambda name: (-durations.get(name, float('inf')), name))
+
+
+def pick_shard(names, costs, index, count):
+    """
+    Deterministically pick the components for shard `index` (1-based) of
+    `count`, balancing the total cost of each shard.
+
+    Components are handed out longest-first to the least-loaded shard.
+    Components without a known cost are weighted as the mean known cost.
+    """
+    known = [costs[name] for name in names if name in costs]
+    default = sum(known) / len(known) if known else 1
+    loads = [0] * count
+    shards = [[] for _ in range(count)]
+    for name in sorted(names, key=lambda name: (-costs.get(name, default),
+                                                name)):
+        target = loads.index(min(loads))
+        loads[target] += costs.get(name, default)
+        shards[target].append(name)
+    return shards[index - 1]
+
+
+def load_manifest(out_dir):
+    """
+    Load the manifest describing the components built into `out_dir`
+    """
+    try:
+        with open(os.path.join(out_dir, MANIFEST_FILE)) as f:
+            manifest = json.load(f)
+    except IOError as e:
+        if e.errno != errno.ENOENT:
+            raise
+        manifest = {}
+    manifest.setdefault('shards', [])
+    manifest.setdefault('components', {})
+    manifest.setdefault('failures', [])
+    return manifest
 
 
-@click.command()
+def save_manifest(out_dir, manifest):
+    with open(os.path.join(out_dir, MANIFEST_FILE), 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+
+
+def ensure_dir(path):
+    try:
+        os.makedirs(path)
+    except OSError as e:
+        if e.errno == errno.EEXIST:
+            pass
+        else:
+            raise
+
+
+class ShardParamType(click.ParamType):
+    name = 'i/N'
+
+    def convert(self, value, param, ctx):
+        try:
+            index, count = (int(x) for x in value.split('/'))
+        except ValueError:
+            self.fail('{} is not of the form i/N'.format(value), param, ctx)
+        if not 1 <= index <= count:
+            self.fail('shard {} is not between 1 and {}'.format(
+                index, count), param, ctx)
+        return index, count
+
+
+@click.group(invoke_without_command=True)
 @click.option(
     '--config', default='sphinxify.yaml',
     help='Path to the sphinxify config file',
-    type=click.File(),
+    type=click.Path(dir_okay=False),
     )
 @click.option(
     '-b', '--build', default='_build',
@@ -82,8 +477,66 @@ def build_component(name, component, out_dir):
         file_okay=False,
         )
     )
-def main(config, build, out):
-    config = yaml.load(config)
+@click.option(
+    '-j', '--jobs', default=1,
+    help='Number of components to build in parallel',
+    type=click.IntRange(min=1),
+    )
+@click.option(
+    '--clone-timeout', default=600,
+    help='Seconds before a `git clone` is abandoned (0 for no limit)',
+    type=click.IntRange(min=0),
+    )
+@click.option(
+    '--build-timeout', default=3600,
+    help='Seconds before a component build is abandoned (0 for no limit)',
+    type=click.IntRange(min=0),
+    )
+@click.option(
+    '--retries', default=2,
+    help='Number of times to retry a failed clone or build',
+    type=click.IntRange(min=0),
+    )
+@click.option(
+    '--backoff', default=5.0,
+    help='Seconds to wait before the first retry, doubled for each retry',
+    type=click.FloatRange(min=0),
+    )
+@click.option(
+    '--only-failed', is_flag=True,
+    help='Only rebuild the components which failed in the previous run',
+    )
+@click.option(
+    '--engine', default='inprocess',
+    help='Run sphinx-versioning in a warm interpreter for each job '
+         '(inprocess) or as a new process for each component (subprocess)',
+    type=click.Choice(['inprocess', 'subprocess']),
+    )
+@click.option(
+    '--cache/--no-cache', default=True,
+    help='Keep Sphinx doctrees for each component & ref in the build DIR '
+         'so unchanged documents are not re-read',
+    )
+@click.option(
+    '--shard', type=ShardParamType(),
+    help='Only build shard i of N (e.g. 2/4)',
+    )
+@click.option(
+    '--costs',
+    help='Manifest of a previous (merged) build, '
+         'used to balance the shards by build duration',
+    type=click.Path(dir_okay=False, exists=True),
+    )
+@click.pass_context
+def main(ctx, config, build, out, jobs, clone_timeout, build_timeout,
+         retries, backoff, only_failed, engine, cache, shard, costs):
+    if ctx.invoked_subcommand is not None:
+        return
+
+    # Not needed by the other commands
+    import yaml
+    with open(config) as f:
+        config = yaml.load(f)
 
     # populate missing repo fields
     for name, component in config['components'].items():
@@ -96,28 +549,313 @@ def main(config, build, out):
     build = os.path.abspath(build)
 
     for dir in out, build:
-        try:
-            os.makedirs(dir)
-        except OSError as e:
-            if e.errno == errno.EEXIST:
-                pass
-            else:
-                raise
+        ensure_dir(dir)
 
-    failures = []
+    state = load_state(build)
 
-    for name, component in config['components'].items():
+    names = list(config['components'])
+    if shard is not None:
+        # Every worker must agree on the split, so this can't use the
+        # (per-worker) state durations
+        weights = {}
+        if costs:
+            with open(costs) as f:
+                previous = json.load(f)['components']
+            weights = {
+                name: component['duration']
+                for name, component in previous.items()
+                }
+        names = pick_shard(names, weights, *shard)
+    if only_failed:
+        names = [name for name in names if name in state['failures']]
+        if not names:
+            logging.warning('No failed components to rebuild')
+            return
+
+    workers = []
+    idle = Queue.Queue()
+
+    def build_one(name):
+        start = time.time()
+        worker = idle.get() if workers else None
         try:
-            with pushd(build):
-                build_component(name, component, out)
+            build_component(
+                name, config['components'][name], build, out,
+                clone_timeout=clone_timeout or None,
+                build_timeout=build_timeout or None,
+                retries=retries,
+                backoff=backoff,
+                cache=cache,
+                worker=worker,
+                )
+        except Aborted:
+            return name, None, 'aborted'
         except Exception as e:
             logging.error(str(e))
-            failures.append((name, str(e)))
+            return name, None, str(e)
+        finally:
+            if worker is not None:
+                idle.put(worker)
+        return name, time.time() - start, None
+
+    def interrupt(signum, frame):
+        raise KeyboardInterrupt()
+
+    ordered = schedule(names, state['durations'])
+    results = []
+    pool = None
+    sigterm = signal.signal(signal.SIGTERM, interrupt)
+    try:
+        # Started before the build threads, so nothing else is running when
+        # they fork
+        if engine == 'inprocess':
+            for _ in range(min(jobs, len(names))):
+                worker = BuildWorker()
+                worker.start()
+                workers.append(worker)
+                idle.put(worker)
+
+        pool = ThreadPool(jobs)
+        # One component at a time, so each free job takes the next longest
+        pending = pool.imap_unordered(build_one, ordered, chunksize=1)
+        for _ in ordered:
+            # Python 2 can't interrupt a wait without a timeout
+            results.append(pending.next(WAIT_FOREVER))
+    except KeyboardInterrupt:
+        abort_all()
+        if pool is not None:
+            # The builds in progress fail straight away now
+            pool.terminate()
+            pool.join()
+            pool = None
+        for worker in workers:
+            worker.stop(kill=True)
+        # Keep the durations of the components which did finish, and count
+        # the rest as failed so --only-failed picks up where this left off
+        for name, duration, error in results:
+            if error is None:
+                state['durations'][name] = duration
+        state['failures'] = sorted(
+            set(state['failures']).union(names).difference(
+                name for name, _, error in results if error is None))
+        save_state(build, state)
+        raise
+    finally:
+        signal.signal(signal.SIGTERM, sigterm)
+        if pool is not None:
+            pool.close()
+            pool.join()
+        for worker in workers:
+            worker.stop()
+
+    manifest = load_manifest(out)
+    if shard is not None or not only_failed:
+        manifest['shards'] = [list(shard)] if shard else []
+
+    failures = []
+    for name, duration, error in results:
+        if error is None:
+            state['durations'][name] = duration
+            manifest['components'][name] = {
+                'dir': get_plugin_name_from_repo(name),
+                'repo': config['components'][name]['repo'],
+                'branch': config['components'][name]['branch'],
+                'duration': duration,
+                }
+        else:
+            failures.append((name, error))
+
+    state['failures'] = sorted(
+        set(state['failures']).difference(names).union(
+            name for name, _ in failures))
+    save_state(build, state)
+    manifest['failures'] = sorted(
+        set(manifest['failures']).difference(names).union(
+            name for name, _ in failures))
+    save_manifest(out, manifest)
+    build_catalog(out, manifest)
+    update_files(out)
 
     if failures:
         logging.error('These components failed: {}'.format(failures))
         exit(1)
 
 
+@main.command()
+@click.argument(
+    'shards', nargs=-1, required=True,
+    type=click.Path(file_okay=False, exists=True),
+    )
+@click.option(
+    '-o', '--out', default='out',
+    help='Output DIR for the merged docs site',
+    type=click.Path(
+        file_okay=False,
+        )
+    )
+def merge(shards, out):
+    """
+    Merge the output DIRs of sharded builds into one docs site
+    """
+    out = os.path.abspath(out)
+    ensure_dir(out)
+    for shard_dir in shards:
+        # Its components would be deleted before they are copied
+        if os.path.samefile(shard_dir, out):
+            raise click.ClickException(
+                'The output DIR can\'t be one of the shards: {}'.format(
+                    shard_dir))
+
+    merged = load_manifest(out)
+    merged['shards'] = []
+    merged['failures'] = []
+    owners = {}
+
+    for shard_dir in shards:
+        manifest = load_manifest(shard_dir)
+        merged['shards'].extend(manifest['shards'])
+        merged['failures'].extend(manifest['failures'])
+
+        for name, component in manifest['components'].items():
+            if name in owners:
+                raise click.ClickException(
+                    '{} was built by both {} and {}'.format(
+                        name, owners[name], shard_dir))
+            owners[name] = shard_dir
+
+            target = os.path.join(out, component['dir'])
+            if os.path.isdir(target):
+                shutil.rmtree(target)
+            shutil.copytree(
+                os.path.join(shard_dir, component['dir']), target)
+            merged['components'][name] = component
+
+    counts = set(count for _, count in merged['shards'])
+    if len(counts) > 1:
+        raise click.ClickException(
+            'Shards from differently sized builds: {}'.format(
+                merged['shards']))
+    for count in counts:
+        missing = (
+            set(range(1, count + 1)) -
+            set(index for index, _ in merged['shards']))
+        if missing:
+            logging.warning('Missing shards: {}'.format(sorted(missing)))
+
+    merged['shards'].sort()
+    merged['failures'] = sorted(
+        set(merged['failures']) - set(owners))
+    save_manifest(out, merged)
+    build_catalog(out, merged)
+    update_files(out)
+
+
+@main.command()
+@click.option(
+    '-o', '--out', default='out',
+    help='Output DIR of the docs site to check',
+    type=click.Path(
+        file_okay=False,
+        exists=True,
+        )
+    )
+@click.option(
+    '-j', '--jobs', default=None,
+    help='Number of worker processes (defaults to the number of CPUs)',
+    type=click.IntRange(min=1),
+    )
+@click.option(
+    '--anchors/--no-anchors', default=True,
+    help='Check that #fragments exist in the target page',
+    )
+@click.option(
+    '--ignore', multiple=True,
+    help='Regex of links to skip (may be repeated)',
+    )
+@click.option(
+    '--site-root', default=None,
+    help='URL path the site is served at (e.g. /), to also check links '
+         'starting with a /. Without it they are treated as external.',
+    )
+def linkcheck(out, jobs, anchors, ignore, site_root):
+    """
+    Check the links between the pages of a built docs site (offline)
+    """
+    start = time.time()
+    broken = check_links(
+        os.path.abspath(out), jobs=jobs, check_anchors=anchors, ignore=ignore,
+        site_root=site_root)
+
+    for (target, reason), pages in sorted(broken.items()):
+        pages = sorted(pages)
+        click.echo('{}: {} (linked from {} page{}, e.g. {})'.format(
+            target, reason,
+            len(pages), '' if len(pages) == 1 else 's',
+            pages[0]))
+
+    click.echo(
+        'Checked links in {:.1f}s'.format(time.time() - start), err=True)
+    if broken:
+        logging.error('{} broken link targets'.format(len(broken)))
+        exit(1)
+
+
+@main.command()
+@click.option(
+    '-o', '--out', default='out',
+    help='Output DIR of the docs site to publish',
+    type=click.Path(
+        file_okay=False,
+        exists=True,
+        )
+    )
+@click.option(
+    '--since',
+    help='Files manifest of the deployed site '
+         '(defaults to {} in the output DIR)'.format(DEPLOYED_MANIFEST),
+    type=click.Path(dir_okay=False),
+    )
+@click.option(
+    '--archive',
+    help='Write a .tar.gz of the added & changed files, '
+         'and a list of the deleted ones, to FILE (- for stdout)',
+    type=click.Path(dir_okay=False, allow_dash=True),
+    )
+@click.option(
+    '--list', 'list_', default=None,
+    help='Write the list of changed files to FILE '
+         '(- for stdout, the default without --archive)',
+    type=click.Path(dir_okay=False, allow_dash=True),
+    )
+@click.option(
+    '--mark-deployed', is_flag=True,
+    help='Record the current files as deployed, '
+         'so the next run only includes later changes',
+    )
+def changes(out, since, archive, list_, mark_deployed):
+    """
+    List or archive the files changed since the site was last deployed
+    """
+    out = os.path.abspath(out)
+    since = since or os.path.join(out, DEPLOYED_MANIFEST)
+    # The site may have been changed since its manifest was written,
+    # and unchanged files aren't hashed again
+    current = update_files(out)
+
+    added, changed, deleted = diff_files(load_files(since), current)
+    click.echo('{} added, {} changed, {} deleted'.format(
+        len(added), len(changed), len(deleted)), err=True)
+
+    if archive:
+        with click.open_file(archive, 'wb') as f:
+            write_archive(f, out, added + changed, deleted)
+    if list_ or not archive:
+        with click.open_file(list_ or '-', 'wb') as f:
+            write_list(f, added, changed, deleted)
+
+    if mark_deployed:
+        save_files(since, current)
+
+
 if __name__ == '__main__':
     main()
@@ -0,0 +1,157 @@
+########
+# Copyright (c) 2016 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+"""
+Persistent per-ref Sphinx cache for builds run by `sphinxify-build`.
+
+sphinx-versioning exports every ref to a new temporary directory and Sphinx
+throws away its pickled environment when the source directory changes, so
+every ref would always be built from scratch. Instead the exported sources
+are mirrored into a stable directory under the cache (only rewriting the
+files which actually changed) and the doctrees are kept next to them, so
+Sphinx can do its normal incremental build.
+"""
+
+import filecmp
+import logging
+import os
+import re
+import shutil
+import sys
+
+
+CACHE_DIR_ENV = 'SPHINXIFY_CACHE_DIR'
+
+RE_INVALID_FILENAME = re.compile(r'[^\w.-]')
+
+# Ref name sphinx-versioning uses to read the conf.py of the working copy.
+# That pass never saves an environment, so there is nothing to cache.
+LOCAL_CONF_REF = '<local>'
+
+# Never part of the docs, and can be huge
+SYNC_EXCLUDE = {'.git'}
+
+
+def current_ref():
+    """
+    Name of the ref sphinx-versioning is building in this process, if any
+    """
+    scv = sys.modules.get('sphinxcontrib.versioning.sphinx_')
+    if scv is not None:
+        return scv.EventHandlers.CURRENT_VERSION
+
+
+def sync_tree(src, dest):
+    """
+    Make `dest` a copy of `src`.
+
+    Files with the same contents are left alone, so only changed files get a
+    new mtime (which is what Sphinx uses to find outdated documents).
+    """
+    seen = set()
+    for dirpath, dirnames, filenames in os.walk(src):
+        dirnames[:] = [d for d in dirnames if d not in SYNC_EXCLUDE]
+        target_dir = os.path.normpath(
+            os.path.join(dest, os.path.relpath(dirpath, src)))
+        if not os.path.isdir(target_dir):
+            os.makedirs(target_dir)
+        seen.add(target_dir)
+        for filename in filenames:
+            source = os.path.join(dirpath, filename)
+            target = os.path.join(target_dir, filename)
+            seen.add(target)
+            if not (
+                    os.path.isfile(target) and
+                    filecmp.cmp(source, target, shallow=False)):
+                shutil.copyfile(source, target)
+
+    for dirpath, dirnames, filenames in os.walk(dest, topdown=False):
+        for filename in filenames:
+            path = os.path.join(dirpath, filename)
+            if path not in seen:
+                os.remove(path)
+        if os.path.normpath(dirpath) not in seen:
+            os.rmdir(dirpath)
+
+
+def in_build_cache(srcdir):
+    cache_dir = os.environ.get(CACHE_DIR_ENV)
+    return bool(cache_dir) and os.path.abspath(srcdir).startswith(
+        os.path.join(os.path.abspath(cache_dir), ''))
+
+
+def touch_sources(env, docnames):
+    """
+    Mark the cached sources of `docnames` as modified.
+
+    Every build of a ref (sphinx-versioning builds each one several times,
+    into different output dirs) shares its environment, so only the first
+    build would know which documents were re-read. Sphinx also rewrites
+    pages whose source is newer than the output, so bumping the source mtime
+    gets the rest of the builds to rewrite them too.
+    """
+    if not in_build_cache(env.srcdir):
+        return
+    for docname in docnames:
+        path = env.doc2path(docname)
+        if os.path.isfile(path):
+            os.utime(path, None)
+
+
+def use_build_cache(app):
+    """
+    Point `app` at the cache for the ref being built, if `sphinxify-build`
+    asked for one.
+
+    Must be called before the environment is loaded (i.e. from `setup`).
+    """
+    cache_dir = os.environ.get(CACHE_DIR_ENV)
+    ref = current_ref()
+    if not cache_dir or ref in (None, LOCAL_CONF_REF):
+        return
+
+    ref_dir = os.path.join(cache_dir, RE_INVALID_FILENAME.sub('_', ref))
+    # sphinxify-build always builds `docs` at the root of the repo, and the
+    # docs refer to files outside of it (e.g. ../plugin.yaml)
+    root = os.path.dirname(app.srcdir)
+    src = os.path.join(ref_dir, 'src')
+    logging.info('Using build cache {}'.format(ref_dir))
+    sync_tree(root, src)
+
+    app.srcdir = os.path.join(src, os.path.relpath(app.srcdir, root))
+    app.doctreedir = os.path.join(ref_dir, 'doctrees')
+    if not os.path.isdir(app.doctreedir):
+        os.makedirs(app.doctreedir)
+
+    # Git refs can't start with a '.', so this can't clash with a ref dir
+    template_dir = os.path.join(cache_dir, '.templates')
+    if not os.path.isdir(template_dir):
+        os.makedirs(template_dir)
+    app.connect(
+        'builder-inited',
+        lambda app: use_template_cache(app, template_dir))
+
+
+def use_template_cache(app, template_dir):
+    """
+    Keep the compiled theme templates, so they are only parsed once rather
+    than by every build
+    """
+    from jinja2 import FileSystemBytecodeCache
+
+    templates = getattr(app.builder, 'templates', None)
+    environment = getattr(templates, 'environment', None)
+    if environment is not None:
+        environment.bytecode_cache = FileSystemBytecodeCache(template_dir)
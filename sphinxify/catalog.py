@@ -0,0 +1,123 @@
+########
+# Copyright (c) 2016 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+"""
+Global catalog of the types documented by every component of the docs site.
+
+The catalog is a single JSON file::
+
+    {
+        "kinds": ["node", ...],
+        "plugins": ["openstack", ...],
+        "refs": ["master", ...],
+        "types": [[name, kind, plugin, ref, url], ...],
+        "prefix_length": 3,
+        "index": {"ser": [type, ...], ...}
+    }
+
+`kind`, `plugin` and `ref` are indexes into the corresponding lists, `url` is
+relative to the catalog, and `index` maps the first 1 to `prefix_length`
+characters of every (lowercased, dot separated) part of a type name to the
+indexes of the types with that part.
+"""
+
+import json
+import os
+
+from . import CATALOG_OBJECTS_FILE, TYPE_MAP
+
+
+CATALOG_FILE = 'cfy-catalog.json'
+
+# Set by sphinxify-build for every component build, so only docs which are
+# part of the site show the catalog lookup (unless `cfy_catalog_url` is set)
+CATALOG_URL_ENV = 'SPHINXIFY_CATALOG_URL'
+
+PREFIX_LENGTH = 3
+
+
+def find_objects(component_dir, root_ref):
+    """
+    Yield `(ref, path, objects)` for every ref built into `component_dir`.
+
+    sphinx-versioning builds the root ref at the top of the component dir and
+    every ref (the root ref included) in a subdirectory named after it.
+    """
+    for dirpath, dirnames, filenames in os.walk(component_dir):
+        dirnames.sort()
+        if CATALOG_OBJECTS_FILE not in filenames:
+            continue
+        with open(os.path.join(dirpath, CATALOG_OBJECTS_FILE)) as f:
+            objects = json.load(f)
+        ref = os.path.relpath(dirpath, component_dir).replace(os.sep, '/')
+        if ref == os.curdir:
+            yield root_ref, '', objects
+        else:
+            yield ref, ref + '/', objects
+
+
+def build_catalog(out_dir, manifest):
+    """
+    Collect the types documented by the components in `manifest` into the
+    catalog in `out_dir`.
+    """
+    kinds = sorted(TYPE_MAP)
+    plugins = []
+    refs = []
+    types = {}
+
+    for name, component in sorted(manifest['components'].items()):
+        plugin = component['dir']
+        for ref, path, objects in find_objects(
+                os.path.join(out_dir, plugin), component['branch']):
+            if ref not in refs:
+                refs.append(ref)
+            for type, kind, uri in objects:
+                # The root ref is found first, so its copy is the one kept
+                types.setdefault((type, plugin, ref), [
+                    type,
+                    kinds.index(kind),
+                    len(plugins),
+                    refs.index(ref),
+                    '{}/{}{}'.format(plugin, path, uri),
+                    ])
+        plugins.append(plugin)
+
+    types = sorted(types.values())
+    index = {}
+    for i, type in enumerate(types):
+        prefixes = set(
+            part[:length]
+            for part in type[0].lower().split('.')
+            for length in range(1, PREFIX_LENGTH + 1)
+            if part
+            )
+        for prefix in prefixes:
+            index.setdefault(prefix, []).append(i)
+
+    catalog = {
+        'kinds': kinds,
+        'plugins': plugins,
+        'refs': refs,
+        'types': types,
+        'prefix_length': PREFIX_LENGTH,
+        'index': index,
+        }
+
+    path = os.path.join(out_dir, CATALOG_FILE)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(catalog, f, separators=(',', ':'), sort_keys=True)
+    os.rename(path + '.tmp', path)
+    return catalog
@@ -0,0 +1,184 @@
+########
+# Copyright (c) 2016 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+"""
+Incremental deploys of a built docs site.
+
+Every build records the contents of its output dir in a files manifest::
+
+    {"path/to/file.html": [sha1, size, mtime], ...}
+
+Comparing it against the manifest of the last deployed site gives the files
+which were added, changed or deleted, so only those have to be published.
+Files whose size & mtime haven't changed since the last manifest are not
+hashed again.
+
+Paths in the manifests are always text, and file names are taken to be UTF-8
+(whatever the locale of the build).
+"""
+
+import errno
+import hashlib
+import json
+import os
+import tarfile
+import time
+from io import BytesIO
+from multiprocessing.pool import ThreadPool
+
+
+FILES_MANIFEST = 'sphinxify-files.json'
+DEPLOYED_MANIFEST = 'sphinxify-deployed.json'
+DELETED_FILE = 'sphinxify-deleted.txt'
+
+# Bookkeeping files which are not part of the site itself
+EXCLUDE = {FILES_MANIFEST, DEPLOYED_MANIFEST}
+
+CHUNK_SIZE = 1 << 16
+
+
+def encode_path(path):
+    return path.encode('utf-8') if isinstance(path, unicode) else path
+
+
+def fs_path(root, path):
+    """
+    Path on disk of the manifest `path` in `root`
+    """
+    return os.path.join(encode_path(root), *encode_path(path).split('/'))
+
+
+def load_files(path):
+    """
+    Load a files manifest, which is empty if it doesn't exist (i.e. nothing
+    has been deployed yet)
+    """
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except IOError as e:
+        if e.errno != errno.ENOENT:
+            raise
+        return {}
+
+
+def save_files(path, files):
+    with open(path + '.tmp', 'w') as f:
+        json.dump(files, f, separators=(',', ':'), sort_keys=True)
+    os.rename(path + '.tmp', path)
+
+
+def hash_file(path):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def hash_tree(root, previous=None, jobs=None):
+    """
+    Build the files manifest of the tree at `root`, reusing the hashes from
+    `previous` for files which look unchanged
+    """
+    previous = previous or {}
+    files = {}
+    pending = []
+    for dirpath, dirnames, filenames in os.walk(encode_path(root)):
+        dirnames.sort()
+        rel = os.path.relpath(dirpath, root)
+        rel = '' if rel == os.curdir else rel.replace(os.sep, '/') + '/'
+        for filename in filenames:
+            path = (rel + filename).decode('utf-8')
+            if path in EXCLUDE:
+                continue
+            stat = os.stat(os.path.join(dirpath, filename))
+            entry = previous.get(path)
+            if entry and entry[1:] == [stat.st_size, stat.st_mtime]:
+                files[path] = entry
+            else:
+                files[path] = [None, stat.st_size, stat.st_mtime]
+                pending.append(path)
+
+    if pending:
+        # hashlib releases the GIL, so threads are enough to keep the disk
+        # busy
+        pool = ThreadPool(jobs)
+        try:
+            digests = pool.map(
+                hash_file,
+                [fs_path(root, path) for path in pending],
+                chunksize=64)
+        finally:
+            pool.close()
+            pool.join()
+        for path, digest in zip(pending, digests):
+            files[path][0] = digest
+
+    return files
+
+
+def update_files(out_dir, jobs=None):
+    """
+    Record the current contents of `out_dir` in its files manifest
+    """
+    path = os.path.join(out_dir, FILES_MANIFEST)
+    files = hash_tree(out_dir, load_files(path), jobs=jobs)
+    save_files(path, files)
+    return files
+
+
+def diff_files(old, new):
+    """
+    Return the sorted `(added, changed, deleted)` paths between two files
+    manifests
+    """
+    added = sorted(path for path in new if path not in old)
+    changed = sorted(
+        path for path in new
+        if path in old and new[path][0] != old[path][0])
+    deleted = sorted(path for path in old if path not in new)
+    return added, changed, deleted
+
+
+def write_list(f, added, changed, deleted):
+    """
+    Write the changes to the binary file object `f`, one per line (UTF-8),
+    prefixed by A(dded), M(odified) or D(eleted)
+    """
+    for status, paths in ('A', added), ('M', changed), ('D', deleted):
+        for path in paths:
+            f.write(u'{} {}\n'.format(status, path).encode('utf-8'))
+
+
+def write_archive(f, root, paths, deleted):
+    """
+    Stream a gzipped tar of `paths` (relative to `root`) to the file object
+    `f`, along with a list of the `deleted` paths
+    """
+    with tarfile.open(fileobj=f, mode='w|gz') as tar:
+        for path in paths:
+            tar.add(
+                fs_path(root, path),
+                arcname=encode_path(path),
+                recursive=False)
+
+        if deleted:
+            data = u''.join(path + u'\n' for path in deleted).encode('utf-8')
+            info = tarfile.TarInfo(DELETED_FILE)
+            info.size = len(data)
+            info.mode = 0o644
+            info.mtime = time.time()
+            tar.addfile(info, BytesIO(data))
@@ -0,0 +1,642 @@
+########
+# Copyright (c) 2016 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+"""
+The Cloudify Sphinx extension: the `cfy` domain & its event handlers.
+
+Loaded by `sphinxify.setup`, so that importing `sphinxify` (e.g. for the
+theme or the CLI) doesn't load Sphinx.
+"""
+
+import os
+import json
+import hashlib
+import logging
+from abc import ABCMeta, abstractproperty
+from contextlib import contextmanager
+from urllib2 import urlopen, URLError
+from StringIO import StringIO
+
+import yaml
+
+from docutils import nodes
+from docutils.statemachine import ViewList
+from sphinx import addnodes
+from sphinx.directives import ObjectDescription
+from sphinx.domains import Domain, ObjType, Index
+from sphinx.roles import XRefRole
+from sphinx.util.docstrings import prepare_docstring
+from sphinx.util.nodes import make_refnode
+
+from . import CATALOG_OBJECTS_FILE, TYPE_MAP, get_plugin_name_from_repo
+from .catalog import CATALOG_URL_ENV
+from .cache import touch_sources, use_build_cache
+from .imports import IMPORT_MIRROR_ENV, ImportResolver, default_cache_dir
+
+
+PLUGIN_VERSIONS_YAML = (
+        'https://github.com/cloudify-cosmo/cloudify-versions/raw'
+        '/master/versions.yaml'
+        )
+
+PLUGIN_DOC_URL_TEMPLATE = '../{}/'
+
+DATATYPES_FILE = 'cfy-datatypes.json'
+
+ROOT_TYPES = [
+    'cloudify.nodes.Root',
+    'cloudify.relationships.depends_on',
+    ]
+
+
+types = {}
+
+# Types from the blueprints' imports. Used for nested properties, but not
+# expected to be documented.
+imported_types = {}
+
+cloudify_versions = None
+
+
+@contextmanager
+def load_file(location, srcdir=''):
+    """
+    load a file from a local path or URL
+    """
+    try:
+        f = urlopen(location)
+    except ValueError:
+        # raised by urlopen for non-url-looking inputs
+        f = open(os.path.join(srcdir, location))
+    except URLError as e:
+        logging.warn('Unable to load {}: {}'.format(location, e))
+        f = StringIO('components: []')
+    yield f
+    f.close()
+
+
+def get_cloudify_versions():
+    """
+    The Cloudify versions list, fetched once per process
+    """
+    global cloudify_versions
+    if cloudify_versions is None:
+        with load_file(PLUGIN_VERSIONS_YAML) as f:
+            cloudify_versions = yaml.load(f)
+    return cloudify_versions
+
+
+def merge_dicts(a, b):
+    """
+    Recursively add the contents of b to a.
+    """
+    for k, v in b.items():
+        if isinstance(v, dict):
+            merge_dicts(a.setdefault(k, {}), v)
+        else:
+            a[k] = v
+
+
+class node(nodes.Element):
+    pass
+
+
+class lazy_datatype(nodes.General, nodes.Element):
+    """
+    Placeholder for the properties of a data type, which the theme fills in
+    from the datatypes payload when it is expanded.
+    """
+
+
+def visit_lazy_datatype_html(self, node):
+    self.body.append(self.starttag(
+        node, 'div', '',
+        CLASS='cfy-lazy-datatype',
+        **{'data-cfy-datatype': node['datatype']}))
+    self.body.append(
+        '<button type="button" class="btn btn-neutral">'
+        'Show properties</button>')
+
+
+def depart_lazy_datatype_html(self, node):
+    self.body.append('</div>\n')
+
+
+def skip_node(self, node):
+    raise nodes.SkipNode
+
+
+def check_all_types_documented(app):
+    for section in [
+            'node_types',
+            'data_types',
+            'relationships',
+            ]:
+        for item in types.get(section, []):
+            if item not in app.env.domains['cfy'].data[section]:
+                app.warn(
+                    '{item} from {section} '
+                    'has not been documented!'.format(
+                        item=item,
+                        section=section,
+                    )
+                )
+
+
+def build_finished(app, exception):
+    if exception is not None:
+        # Don't mask an already raised exception
+        raise exception
+    check_all_types_documented(app)
+    write_catalog_objects(app)
+    write_datatypes(app)
+
+
+def write_catalog_objects(app):
+    """
+    Dump the documented types so `sphinxify-build` can collect them into the
+    global type catalog
+    """
+    if app.builder.format != 'html':
+        return
+
+    kinds = {v: k for k, v in TYPE_MAP.items()}
+    objects = []
+    for name, _, type, docname, anchor, _ in (
+            app.env.domains['cfy'].get_objects()):
+        objects.append([
+            name,
+            kinds[type],
+            '{}#{}'.format(app.builder.get_target_uri(docname), anchor),
+            ])
+
+    with open(os.path.join(app.outdir, CATALOG_OBJECTS_FILE), 'w') as f:
+        json.dump(sorted(objects), f, separators=(',', ':'))
+
+
+class CfyDirective(ObjectDescription):
+    __metaclass__ = ABCMeta
+
+    def __init__(self, *args, **kwargs):
+        super(CfyDirective, self).__init__(*args, **kwargs)
+
+        self.ent_name = self.arguments[0].strip()
+        self.data = types[self.section].pop(self.ent_name)
+
+    def handle_signature(self, sig, signode):
+        signode.append(addnodes.desc_name(sig, sig))
+        return sig, sig.split('.')[:-2]
+
+    def add_target_and_index(self, name, sig, signode):
+        if sig not in self.state.document.ids:
+            signode['names'].append(sig)
+            signode['ids'].append(sig)
+            signode['first'] = (not self.names)
+            self.state.document.note_explicit_target(signode)
+            objects = self.env.domaindata['cfy'][self.section]
+            objects[sig] = self.data
+            objects[sig]['sphinx_link'] = (self.env.docname, self.objtype)
+
+    def generate_properties(self, node, properties):
+        """
+        Add the properties to the node
+        """
+        for name, property in properties.items():
+            default = property.get('default')
+            type = property.get('type')
+
+            info = '**type:** :cfy:datatype:`{}`'.format(type) if type else ''
+
+            if default is not None:
+                if default != '':
+                    info += ' **default:** ``{}``'.format(property['default'])
+            elif property.get('required', True):
+                info += ' **required**'
+
+            try:
+                description = property['description']
+            except KeyError:
+                if type in {
+                        'string',
+                        'boolean',
+                        'list',
+                        'integer',
+                        None,
+                        }:
+                    # only custom defined types are allowed to not have a
+                    # description
+                    self.state.document.settings.env.app.warn(
+                        '{type} property {name} has no description'.format(
+                            type=self.arguments[0],
+                            name=name,
+                        ))
+                description = ''
+
+            lines = ViewList(prepare_docstring(
+                info + '\n\n' + description + '\n\n'))
+
+            term = nodes.term('', name)
+            definition = nodes.definition()
+            self.state.nested_parse(
+                    lines,
+                    self.content_offset + 4,
+                    definition,
+                    )
+
+            if type not in [
+                    'string',
+                    'boolean',
+                    'list',
+                    'integer',
+                    ]:
+                # Try tp get the nested properties of the type
+                data_type = types.get('data_types', {}).get(type)
+                # Types are removed from `types` once they are documented
+                documented = (
+                    data_type or
+                    type in self.env.domaindata['cfy']['data_types'])
+                if documented and self.env.config.cfy_nested_types == 'lazy':
+                    definition.append(lazy_datatype('', datatype=type))
+                else:
+                    # Imported types aren't documented here, so are always
+                    # inlined
+                    data_type = data_type or imported_types.get(
+                        'data_types', {}).get(type)
+                    if data_type:
+                        sub_props = nodes.definition_list()
+                        definition.append(sub_props)
+                        self.generate_properties(
+                                sub_props,
+                                data_type['properties']
+                                )
+
+            node.append(nodes.definition_list_item(
+                '',
+                term,
+                definition,
+                ))
+
+    def after_contentnode(self, node):
+        # derived_from:
+        if (
+                self.ent_name not in ROOT_TYPES and
+                self.section != 'data_types'
+                ):
+            deriv = self.data['derived_from']
+            xref_node = addnodes.pending_xref(
+                    '', refdomain='cfy', reftype=self.kind,
+                    reftarget=deriv,
+                    modname=None, classname=None,
+                    )
+            xref_node += nodes.Text(deriv, deriv)
+            node.append(nodes.paragraph(
+                'Derived from: ', 'Derived from: ',
+                xref_node,
+                ))
+
+        if 'properties' in self.data:
+            node.append(nodes.rubric('', 'Properties:'))
+
+            props = nodes.definition_list()
+            if self.section == 'data_types':
+                # Used to find the properties for the lazy datatypes payload
+                props['cfy_datatype'] = self.ent_name
+            node.append(props)
+
+            self.generate_properties(props, self.data['properties'])
+
+    def run(self):
+        indexnode, node = super(CfyDirective, self).run()
+
+        self.after_contentnode(node.children[-1])
+
+        return [indexnode, node]
+
+    @abstractproperty
+    def section():
+        """
+        Name of the section in `plugin.yaml` for this type.
+        """
+
+    @abstractproperty
+    def kind():
+        """
+        The kind of object. Used for Sphinx internals & referencing.
+        """
+
+
+class CfyXRefRole(XRefRole):
+    pass
+
+
+class Node(CfyDirective):
+    section = 'node_types'
+    kind = 'node'
+
+
+class DataType(CfyDirective):
+    section = 'data_types'
+    kind = 'datatype'
+
+
+class Relationship(CfyDirective):
+    section = 'relationships'
+    kind = 'relationship'
+
+
+class CfyIndex(Index):
+
+    name = 'cfyindex'
+    localname = 'Cloudify Types Index'
+    shortname = 'cfyindex'
+
+    def generate(self, docnames=None):
+        content = {}
+
+        for kind in self.domain.initial_data:
+            items = sorted(self.domain.data[kind].items())
+
+            for type, data in items:
+                docname = data['sphinx_link'][0]
+                if docnames and docname not in docnames:
+                    continue
+
+                content.setdefault(type.split('.')[-1][0].lower(), []).append([
+                    type,  # name
+                    0,  # subtype (0 == normal entry)
+                    docname,  # docname
+                    type,  # anchor
+                    '',  # extra info
+                    '',  # qualifier
+                    '',  # description
+                    ])
+
+        return sorted(content.items()), False
+
+
+class CfyDomain(Domain):
+
+    name = 'cfy'
+    description = 'Cloudify DSL'
+
+    object_types = {
+            'node': ObjType('node', 'node'),
+            'datatype': ObjType('datatypes', 'rel'),
+            'rel': ObjType('relationship', 'rel'),
+            }
+
+    directives = {
+            'node': Node,
+            'datatype': DataType,
+            'rel': Relationship,
+            }
+
+    roles = {
+            'node': CfyXRefRole(),
+            'datatype': CfyXRefRole(),
+            'rel': CfyXRefRole(),
+            }
+
+    indices = [
+            CfyIndex,
+            ]
+
+    initial_data = {v: {} for v in TYPE_MAP.values()}
+
+    def __init__(self, *args, **kwargs):
+        super(CfyDomain, self).__init__(*args, **kwargs)
+
+        # Don't leak types between builds run in the same interpreter
+        types.clear()
+        imported_types.clear()
+
+        config = self.env.config
+        resolver = ImportResolver(
+            cache_dir=(
+                default_cache_dir() if config.cfy_import_cache is None
+                else config.cfy_import_cache),
+            mirror=(
+                config.cfy_import_mirror or
+                os.environ.get(IMPORT_MIRROR_ENV)),
+            timeout=config.cfy_import_timeout,
+            )
+        blueprints, imports = resolver.resolve(
+            config.cfy_blueprint_paths, self.env.srcdir,
+            follow_imports=config.cfy_resolve_imports)
+
+        digest = hashlib.sha1()
+        for document in blueprints:
+            digest.update(document.digest)
+            merge_dicts(types, document.data)
+        for document in imports:
+            digest.update(document.digest)
+            merge_dicts(imported_types, document.data)
+        self.blueprint_digest = digest.hexdigest()
+
+        self.cloudify_versions = get_cloudify_versions()
+
+    def load_file(self, location):
+        """
+        load a file from a local path (relative to the docs) or URL
+        """
+        return load_file(location, self.env.srcdir)
+
+    def clear_doc(self, docname):
+        for section in TYPE_MAP.values():
+            for name, obj in list(self.data[section].items()):
+                if obj['sphinx_link'][0] == docname:
+                    del self.data[section][name]
+
+    def resolve_xref(
+            self, env, fromdocname, builder, type, target, node, contnode):
+        try:
+            obj = self.data[TYPE_MAP[type]][target]['sphinx_link']
+        except KeyError:
+            pass
+        else:
+            return make_refnode(
+                    builder, fromdocname, obj[0], target, contnode, target)
+
+    def get_objects(self):
+        for type in (
+                'node_types',
+                'data_types',
+                'relationships',
+                ):
+            for name, obj in self.data[type].items():
+                yield (
+                        name,
+                        name,
+                        type,
+                        obj['sphinx_link'][0],
+                        name,
+                        1,
+                        )
+
+
+def env_get_outdated(app, env, added, changed, removed):
+    """
+    The type documentation comes from the blueprints, so every document has
+    to be re-read when they change.
+    """
+    digest = env.domains['cfy'].blueprint_digest
+    previous = getattr(env, 'cfy_blueprint_digest', digest)
+    env.cfy_blueprint_digest = digest
+
+    outdated = set()
+    if previous != digest:
+        outdated = env.found_docs - added - changed
+    touch_sources(env, added | changed | outdated)
+    return list(outdated)
+
+
+def datatypes_payload(app):
+    """
+    Rendered properties of every data type documented in this build,
+    including the ones from previous builds of pages which weren't rewritten
+    """
+    try:
+        return app.builder.cfy_datatypes
+    except AttributeError:
+        pass
+    try:
+        with open(os.path.join(app.outdir, DATATYPES_FILE)) as f:
+            payload = json.load(f)
+    except (IOError, ValueError):
+        payload = {}
+    app.builder.cfy_datatypes = payload
+    return payload
+
+
+def collect_datatypes(app, doctree, docname):
+    """
+    Render the properties of the data types documented in `docname` for the
+    lazy datatypes payload
+    """
+    if (
+            app.config.cfy_nested_types != 'lazy' or
+            not hasattr(app.builder, 'render_partial')):
+        return
+
+    payload = datatypes_payload(app)
+    for props in doctree.traverse(nodes.definition_list):
+        if 'cfy_datatype' in props:
+            payload[props['cfy_datatype']] = {
+                # links in the html are relative to this page
+                'page': app.builder.get_target_uri(docname),
+                'html': app.builder.render_partial(
+                    props.deepcopy())['fragment'],
+                }
+
+
+def write_datatypes(app):
+    if (
+            app.config.cfy_nested_types != 'lazy' or
+            not hasattr(app.builder, 'render_partial')):
+        return
+
+    payload = datatypes_payload(app)
+    documented = app.env.domains['cfy'].data['data_types']
+    for datatype in list(payload):
+        if datatype not in documented:
+            del payload[datatype]
+
+    with open(os.path.join(app.outdir, DATATYPES_FILE), 'w') as f:
+        json.dump(payload, f, separators=(',', ':'), sort_keys=True)
+
+
+def html_page_context(app, pagename, templatename, context, doctree):
+    """
+    Hook to inject extra details into the template
+    """
+    plugins = context['plugin_links'] = [
+            ]
+    for plugin in app.env.domains['cfy'].cloudify_versions['components']:
+        if plugin.endswith('-plugin'):
+            thing = get_plugin_name_from_repo(plugin)
+            plugins.append({
+                'text': thing,
+                'target': PLUGIN_DOC_URL_TEMPLATE.format(thing),
+                })
+
+    context['cfy_catalog_url'] = (
+        os.environ.get(CATALOG_URL_ENV, '')
+        if app.config.cfy_catalog_url is None
+        else app.config.cfy_catalog_url)
+    if app.config.cfy_nested_types == 'lazy':
+        context['cfy_datatypes_url'] = context['pathto'](DATATYPES_FILE, 1)
+
+
+def setup(app):
+    app.add_config_value(
+            'cfy_blueprint_paths',
+            default=['../plugin.yaml'],
+            rebuild='env',
+            )
+
+    app.add_config_value(
+            'cfy_resolve_imports',
+            default=True,
+            rebuild='env',
+            )
+
+    app.add_config_value(
+            'cfy_import_cache',
+            default=None,
+            rebuild='',
+            )
+
+    app.add_config_value(
+            'cfy_import_mirror',
+            default=None,
+            rebuild='',
+            )
+
+    app.add_config_value(
+            'cfy_import_timeout',
+            default=30,
+            rebuild='',
+            )
+
+    app.add_config_value(
+            'cfy_catalog_url',
+            default=None,
+            rebuild='html',
+            )
+
+    app.add_config_value(
+            'cfy_nested_types',
+            default='inline',
+            rebuild='env',
+            )
+
+    use_build_cache(app)
+
+    app.add_node(
+            lazy_datatype,
+            html=(visit_lazy_datatype_html, depart_lazy_datatype_html),
+            latex=(skip_node, None),
+            text=(skip_node, None),
+            man=(skip_node, None),
+            texinfo=(skip_node, None),
+            )
+    app.add_domain(CfyDomain)
+
+    app.connect('env-get-outdated', env_get_outdated)
+    app.connect('doctree-resolved', collect_datatypes)
+    app.connect('html-page-context', html_page_context)
+    app.connect('build-finished', build_finished)
+
+    return {'version': '0.1'}
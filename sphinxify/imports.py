@@ -0,0 +1,384 @@
+########
+# Copyright (c) 2016 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+"""
+Resolver for the `imports:` of blueprints.
+
+The import graph is walked a level at a time, fetching all the remote
+documents of a level concurrently (each thread keeps one connection open per
+host). Fetched documents are stored in a content addressed cache::
+
+    <cache>/urls.json           {url: {"sha1": ..., "etag": ..., ...}, ...}
+    <cache>/objects/ab/ab12...  the document with that sha1
+
+Cached URLs are revalidated with a conditional GET, so unchanged documents
+aren't downloaded again but a branch URL still picks up new commits. If the
+request fails, imports fall back to the cached copy (with a warning), so
+builds work offline. A local mirror directory (laid out as
+`<mirror>/<host>/<path>`) can be used instead of the network altogether.
+"""
+
+import hashlib
+import httplib
+import json
+import logging
+import os
+import socket
+import tempfile
+import threading
+from collections import namedtuple
+from multiprocessing.pool import ThreadPool
+from urlparse import urljoin, urlsplit
+
+import yaml
+
+
+IMPORT_MIRROR_ENV = 'SPHINXIFY_IMPORT_MIRROR'
+
+REMOTE_SCHEMES = ('http', 'https')
+
+MAX_REDIRECTS = 5
+
+# Response headers kept in the cache to revalidate a URL, and the request
+# headers they are sent back as
+VALIDATORS = {
+    'etag': 'If-None-Match',
+    'last-modified': 'If-Modified-Since',
+    }
+
+Document = namedtuple('Document', 'location digest data')
+
+# Parsed documents by digest, so every unique document is only parsed once
+# per process
+parsed = {}
+
+
+class FetchError(Exception):
+    pass
+
+
+def default_cache_dir():
+    return os.path.join(
+        os.environ.get('XDG_CACHE_HOME') or
+        os.path.join(os.path.expanduser('~'), '.cache'),
+        'sphinxify',
+        'imports',
+        )
+
+
+def is_remote(location):
+    return urlsplit(location).scheme in REMOTE_SCHEMES
+
+
+def write_atomic(path, data):
+    """
+    Write `data` to `path` so concurrent builds never see a partial file
+    """
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.rename(tmp, path)
+    except Exception:
+        os.remove(tmp)
+        raise
+
+
+def parse(content):
+    digest = hashlib.sha1(content).hexdigest()
+    try:
+        data = parsed[digest]
+    except KeyError:
+        data = parsed[digest] = yaml.load(content) or {}
+    return digest, data
+
+
+class ImportResolver(object):
+
+    def __init__(self, cache_dir=None, mirror=None, timeout=30, jobs=8):
+        self.cache_dir = cache_dir
+        self.mirror = mirror
+        self.timeout = timeout
+        self.jobs = jobs
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.urls = {}
+        self.new_urls = {}
+        if cache_dir:
+            try:
+                with open(os.path.join(cache_dir, 'urls.json')) as f:
+                    self.urls = json.load(f)
+            except (IOError, ValueError):
+                pass
+
+    def object_path(self, digest):
+        return os.path.join(self.cache_dir, 'objects', digest[:2], digest)
+
+    def cache_entry(self, url):
+        entry = self.urls.get(url)
+        if isinstance(entry, basestring):
+            # Written by an older version, which only kept the digest
+            entry = {'sha1': entry}
+        return entry
+
+    def from_cache(self, url):
+        """
+        Return `(content, entry)` of the cached copy of `url`, or `(None,
+        None)` if there is none
+        """
+        entry = self.cache_entry(url)
+        if entry is None:
+            return None, None
+        try:
+            with open(self.object_path(entry['sha1']), 'rb') as f:
+                return f.read(), entry
+        except IOError:
+            return None, None
+
+    def store(self, url, content, response):
+        digest = hashlib.sha1(content).hexdigest()
+        path = self.object_path(digest)
+        if not os.path.isfile(path):
+            if not os.path.isdir(os.path.dirname(path)):
+                try:
+                    os.makedirs(os.path.dirname(path))
+                except OSError:
+                    # Created by a concurrent build
+                    pass
+            write_atomic(path, content)
+        entry = {'sha1': digest}
+        for header in VALIDATORS:
+            value = response.getheader(header)
+            if value:
+                entry[header] = value
+        with self.lock:
+            self.new_urls[url] = entry
+
+    def save(self):
+        """
+        Add the URLs fetched by this resolver to the cache index
+        """
+        if not (self.cache_dir and self.new_urls):
+            return
+        path = os.path.join(self.cache_dir, 'urls.json')
+        # Other builds may have added URLs since it was loaded
+        try:
+            with open(path) as f:
+                urls = json.load(f)
+        except (IOError, ValueError):
+            urls = {}
+        urls.update(self.new_urls)
+        write_atomic(path, json.dumps(urls, indent=2, sort_keys=True))
+        self.urls = urls
+        self.new_urls = {}
+
+    def connection(self, scheme, netloc):
+        connections = self.local.__dict__.setdefault('connections', {})
+        try:
+            return connections[scheme, netloc]
+        except KeyError:
+            cls = (
+                httplib.HTTPSConnection if scheme == 'https'
+                else httplib.HTTPConnection)
+            conn = connections[scheme, netloc] = cls(
+                netloc, timeout=self.timeout)
+            return conn
+
+    def close_connection(self, scheme, netloc):
+        connections = self.local.__dict__.get('connections', {})
+        conn = connections.pop((scheme, netloc), None)
+        if conn is not None:
+            conn.close()
+
+    def get(self, url, headers=None):
+        """
+        GET `url`, following redirects, over this thread's connection to
+        the host.
+
+        Returns `(body, response)`. `body` is `None` if `headers` made it a
+        conditional request and the document hasn't been modified.
+        """
+        conditional = bool(headers)
+        headers = dict(headers or {})
+        headers['User-Agent'] = 'sphinxify'
+        for _ in range(MAX_REDIRECTS + 1):
+            parts = urlsplit(url)
+            path = parts.path or '/'
+            if parts.query:
+                path += '?' + parts.query
+
+            # A kept-alive connection may have been closed by the server, so
+            # a failure is retried once on a new connection
+            for attempt in range(2):
+                conn = self.connection(parts.scheme, parts.netloc)
+                try:
+                    conn.request('GET', path, headers=headers)
+                    response = conn.getresponse()
+                    body = response.read()
+                    break
+                except (httplib.HTTPException, socket.error) as e:
+                    self.close_connection(parts.scheme, parts.netloc)
+                    if attempt or isinstance(e, socket.timeout):
+                        raise FetchError(e)
+
+            if response.getheader('connection', '').lower() == 'close':
+                self.close_connection(parts.scheme, parts.netloc)
+
+            if response.status in (301, 302, 303, 307, 308):
+                url = urljoin(url, response.getheader('location'))
+            elif response.status == 200:
+                return body, response
+            elif response.status == 304 and conditional:
+                return None, response
+            else:
+                raise FetchError('{} {}'.format(
+                    response.status, response.reason))
+        raise FetchError('too many redirects')
+
+    def load(self, location, stale=False):
+        """
+        Return the contents of `location`. Raises `IOError` or `FetchError` if
+        it can't be loaded.
+
+        If `stale`, the cached copy of a URL is used when it can't be fetched.
+        """
+        if not is_remote(location):
+            with open(location, 'rb') as f:
+                return f.read()
+
+        if self.mirror:
+            parts = urlsplit(location)
+            with open(os.path.join(
+                    self.mirror, parts.netloc,
+                    *parts.path.strip('/').split('/')), 'rb') as f:
+                return f.read()
+
+        cached, entry = (
+            self.from_cache(location) if self.cache_dir else (None, None))
+        headers = {}
+        if cached is not None:
+            for header, request_header in VALIDATORS.items():
+                if entry.get(header):
+                    headers[request_header] = entry[header]
+
+        try:
+            content, response = self.get(location, headers)
+        except FetchError as e:
+            if stale and cached is not None:
+                logging.warn('Using cached copy of {}: {}'.format(location, e))
+                return cached
+            raise FetchError('Unable to load {}: {}'.format(location, e))
+
+        if content is None:
+            return cached
+        if self.cache_dir:
+            self.store(location, content, response)
+        return content
+
+    def fetch(self, location):
+        """
+        Like `load`, but returns `None` (with a warning) if `location` can't
+        be loaded. Used for imports, which the docs can do without.
+        """
+        try:
+            return self.load(location, stale=True)
+        except IOError as e:
+            logging.warn('Unable to load {}: {}'.format(location, e))
+        except FetchError as e:
+            logging.warn(str(e))
+
+    def resolve(self, locations, srcdir='', follow_imports=True):
+        """
+        Load the blueprints at `locations` (local paths are relative to
+        `srcdir`) and, if `follow_imports`, everything they import.
+
+        Returns `(blueprints, imports)`, both lists of `Document`s, in the
+        order they were found. Every document is only included once.
+        """
+        seen = set()
+        blueprints = []
+        imports = []
+        level = []
+        for location in locations:
+            if not is_remote(location):
+                location = os.path.normpath(os.path.join(srcdir, location))
+            if location not in seen:
+                seen.add(location)
+                level.append(location)
+
+        pool = None
+        try:
+            found = blueprints
+            while level:
+                # A blueprint which can't be loaded is an error
+                load = self.load if found is blueprints else self.fetch
+                remote = [
+                    location for location in level if is_remote(location)]
+                if len(remote) > 1 and self.jobs > 1:
+                    if pool is None:
+                        pool = ThreadPool(self.jobs)
+                    contents = dict(zip(remote, pool.map(load, remote)))
+                else:
+                    contents = {}
+
+                next_level = []
+                digests = set(d.digest for d in blueprints + imports)
+                for location in level:
+                    if location in contents:
+                        content = contents[location]
+                    else:
+                        content = load(location)
+                    if content is None:
+                        continue
+                    digest, data = parse(content)
+                    if digest in digests:
+                        # The same document at a different location
+                        continue
+                    digests.add(digest)
+                    found.append(Document(location, digest, data))
+
+                    if not (follow_imports and isinstance(data, dict)):
+                        continue
+                    for target in data.get('imports') or []:
+                        target = self.join(location, target)
+                        if target is not None and target not in seen:
+                            seen.add(target)
+                            next_level.append(target)
+
+                level = next_level
+                found = imports
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+            self.save()
+
+        return blueprints, imports
+
+    def join(self, base, target):
+        """
+        Location of the import `target` of the document at `base`
+        """
+        scheme = urlsplit(target).scheme
+        if scheme in REMOTE_SCHEMES:
+            return target
+        elif scheme and len(scheme) > 1:
+            # e.g. `plugin:` imports, which are resolved by the manager
+            logging.debug('Skipping import {}'.format(target))
+        elif is_remote(base):
+            return urljoin(base, target)
+        else:
+            return os.path.normpath(
+                os.path.join(os.path.dirname(base), target))
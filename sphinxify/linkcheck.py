@@ -0,0 +1,196 @@
+########
+# Copyright (c) 2016 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+"""
+Offline link checker for a built docs site.
+
+Every file and every HTML anchor in the site is indexed once (the HTML is
+parsed by a pool of worker processes), then each local link is resolved
+against that index. Nothing is fetched from the network.
+"""
+
+import os
+import posixpath
+import re
+from itertools import imap
+from multiprocessing import Pool, cpu_count
+from urllib import unquote
+from urlparse import urlsplit
+
+
+# Keeps the opening tag, so the `src` of external scripts is still checked
+SCRIPT_RE = re.compile(r'(<script\b[^>]*>).*?</script>', re.S)
+COMMENT_RE = re.compile(r'<!--.*?-->', re.S)
+# Sphinx & docutils always write double quoted lowercase attributes, and
+# escape quotes in text, so there's no need to parse the tags themselves.
+ATTR_RE = re.compile(r' (id|name|href|src)="([^"]*)"')
+
+
+def unescape(value):
+    return (
+        value
+        .replace('&lt;', '<')
+        .replace('&gt;', '>')
+        .replace('&quot;', '"')
+        .replace('&#39;', "'")
+        .replace('&amp;', '&')
+        )
+
+
+def parse_page(args):
+    """
+    Return `(page, anchors, links)` for the HTML file `page` in `root`
+    """
+    root, page, site_root = args
+    with open(os.path.join(root, page)) as f:
+        html = f.read()
+
+    # Skip links in inline scripts and comments
+    if '<script' in html:
+        html = SCRIPT_RE.sub(r'\1', html)
+    if '<!--' in html:
+        html = COMMENT_RE.sub('', html)
+
+    base = posixpath.dirname(page)
+    anchors = set()
+    links = set()
+    for attr, value in ATTR_RE.findall(html.replace('\n', ' ')):
+        if '&' in value:
+            value = unescape(value)
+        if attr in ('id', 'name'):
+            anchors.add(value)
+        else:
+            resolved = resolve(base, value, site_root)
+            if resolved is not None:
+                links.add((value,) + resolved)
+    return page, anchors, links
+
+
+def normalize_site_root(site_root):
+    site_root = site_root.strip('/')
+    return '/{}/'.format(site_root) if site_root else '/'
+
+
+def resolve(base, link, site_root=None, cache={}):
+    """
+    Resolve `link` from a page in the `base` dir to a `(path, fragment)` in
+    the site, or `None` if it doesn't point into the site.
+
+    Root-absolute links (`/...`) only point into the site if it is served
+    at the URL path `site_root`.
+    """
+    try:
+        return cache[base, link, site_root]
+    except KeyError:
+        pass
+
+    url = urlsplit(link)
+    path = unquote(url.path)
+    if url.scheme or url.netloc:
+        resolved = None
+    elif path.startswith('/') and (
+            site_root is None or not (path + '/').startswith(site_root)):
+        # Somewhere else on the same host
+        resolved = None
+    else:
+        if not path:
+            # Same page. Resolved by the caller.
+            target = ''
+        elif path.startswith('/'):
+            target = posixpath.normpath(path[len(site_root):] or '.')
+        else:
+            target = posixpath.normpath(posixpath.join(base, path))
+        if path.endswith('/') or target == '.':
+            target = posixpath.normpath(posixpath.join(target, 'index.html'))
+        resolved = target, url.fragment
+
+    cache[base, link, site_root] = resolved
+    return resolved
+
+
+def check_links(
+        root, jobs=None, check_anchors=True, ignore=(), site_root=None):
+    """
+    Check every local link in the site at `root`. Root-absolute links are
+    only checked if `site_root` (the URL path the site is served at) is
+    given.
+
+    Returns a dict mapping each broken `(target, reason)` to the pages which
+    link to it.
+    """
+    files = set()
+    dirs = set()
+    pages = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        rel = os.path.relpath(dirpath, root)
+        rel = '' if rel == os.curdir else rel.replace(os.sep, '/') + '/'
+        dirs.add(rel.rstrip('/') or '.')
+        for filename in filenames:
+            files.add(rel + filename)
+            if filename.endswith('.html'):
+                pages.append(rel + filename)
+
+    anchors = {}
+    links = {}
+    if site_root is not None:
+        site_root = normalize_site_root(site_root)
+    tasks = [(root, page, site_root) for page in pages]
+    if (jobs or cpu_count()) > 1:
+        pool = Pool(jobs)
+        results = pool.imap_unordered(parse_page, tasks, chunksize=64)
+    else:
+        pool = None
+        results = imap(parse_page, tasks)
+    try:
+        for page, page_anchors, page_links in results:
+            anchors[page] = page_anchors
+            links[page] = page_links
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+
+    ignore = [re.compile(pattern) for pattern in ignore]
+
+    def check(target, fragment):
+        if target == '..' or target.startswith('../'):
+            return target, 'outside of the site'
+        elif target in dirs:
+            if target + '/index.html' not in files:
+                return target, 'directory without index.html'
+        elif target not in files:
+            return target, 'missing file'
+        elif (
+                check_anchors and fragment and
+                target in anchors and
+                fragment not in anchors[target]):
+            return '{}#{}'.format(target, fragment), 'missing anchor'
+
+    # Most links (navigation etc.) are shared by many pages
+    verdicts = {}
+    broken = {}
+    for page, page_links in links.items():
+        for link, target, fragment in page_links:
+            if ignore and any(pattern.search(link) for pattern in ignore):
+                continue
+            target = target or page
+            try:
+                verdict = verdicts[target, fragment]
+            except KeyError:
+                verdict = verdicts[target, fragment] = check(target, fragment)
+            if verdict is not None:
+                broken.setdefault(verdict, set()).add(page)
+
+    return broken
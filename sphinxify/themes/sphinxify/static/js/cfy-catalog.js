@@ -0,0 +1,75 @@
+// Autocomplete for types across all plugins, using the catalog written by
+// `sphinxify-build` (see sphinxify/catalog.py for the format).
+$( document ).ready(function() {
+  var widget = $("#cfy-type-lookup");
+  var input = widget.find("input");
+  var results = widget.find(".cfy-type-lookup-results");
+  var catalogUrl = widget.data("catalog");
+  // Entry URLs are relative to the directory holding the catalog
+  var base = catalogUrl.substring(0, catalogUrl.lastIndexOf("/") + 1);
+  var catalog = null;
+  var MAX_RESULTS = 10;
+
+  function load() {
+    if (catalog === null) {
+      catalog = $.getJSON(catalogUrl).fail(function() {
+        widget.hide();
+      });
+    }
+    return catalog;
+  }
+
+  function lookup(data, query) {
+    var segments = query.split(".").sort(function(a, b) {
+      return b.length - a.length;
+    });
+    // The longest segment is the most selective one to look up
+    var key = segments[0].substring(0, data.prefix_length);
+    var ids = data.index[key] || [];
+    var matches = [];
+    for (var i = 0; i < ids.length && matches.length < MAX_RESULTS; i++) {
+      var type = data.types[ids[i]];
+      if (type[0].toLowerCase().indexOf(query) !== -1) {
+        matches.push(type);
+      }
+    }
+    return matches;
+  }
+
+  function render(data, matches) {
+    results.empty();
+    $.each(matches, function(_, type) {
+      var label = data.plugins[type[2]] + " (" + data.refs[type[3]] + ", " +
+        data.kinds[type[1]] + ")";
+      results.append($("<li class='toctree-l1'>").append(
+        $("<a class='reference external'>")
+          .attr("href", base + type[4])
+          .text(type[0])
+          .append($("<br><small>").text(label))
+      ));
+    });
+  }
+
+  input.on("focus", load);
+  input.on("input", function() {
+    var query = $.trim(input.val()).toLowerCase();
+    if (!query) {
+      results.empty();
+      return;
+    }
+    load().done(function(data) {
+      // Ignore responses to stale input
+      if ($.trim(input.val()).toLowerCase() === query) {
+        render(data, lookup(data, query));
+      }
+    });
+  });
+  input.on("keydown", function(e) {
+    if (e.which === 13) {
+      var first = results.find("a").first();
+      if (first.length) {
+        window.location.href = first.attr("href");
+      }
+    }
+  });
+});
@@ -0,0 +1,48 @@
+// Expand the properties of nested data types on demand (cfy_nested_types =
+// 'lazy'), from the payload of rendered properties written by the extension.
+$( document ).ready(function() {
+  var payloadUrl = $("#cfy-lazy-datatypes").data("payload");
+  var payload = null;
+
+  function load() {
+    if (payload === null) {
+      payload = $.getJSON(payloadUrl);
+    }
+    return payload;
+  }
+
+  // Links in the payload are relative to the page the type is documented on
+  function rebase(html, page) {
+    var base = new URL(DOCUMENTATION_OPTIONS.URL_ROOT + page, location.href);
+    html.find("a[href]").each(function() {
+      var href = $(this).attr("href");
+      if (!/^([a-z]+:|\/)/i.test(href)) {
+        $(this).attr("href", new URL(href, base).href);
+      }
+    });
+    return html;
+  }
+
+  $(document).on("click", ".cfy-lazy-datatype > button", function() {
+    var placeholder = $(this).parent();
+    var button = $(this);
+    var expanded = placeholder.children("dl");
+
+    if (expanded.length) {
+      expanded.toggle();
+      button.text(expanded.is(":visible") ? "Hide properties" : "Show properties");
+      return;
+    }
+
+    load().done(function(data) {
+      var datatype = data[placeholder.data("cfy-datatype")];
+      if (!datatype) {
+        button.remove();
+        return;
+      }
+      placeholder.append(
+        rebase($($.parseHTML(datatype.html)).filter("dl"), datatype.page));
+      button.text("Hide properties");
+    });
+  });
+});
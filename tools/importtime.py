@@ -0,0 +1,77 @@
+########
+# Copyright (c) 2016 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#    * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    * See the License for the specific language governing permissions and
+#    * limitations under the License.
+
+"""
+Measure the import time of the sphinxify entry points.
+
+Each one is imported in a fresh interpreter (best of --repeat runs). Fails if
+the light entry points (the theme & the CLI) load any of the heavy modules
+only the extension needs.
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+
+
+# name, code, light
+ENTRY_POINTS = [
+    ('theme', 'import sphinxify; sphinxify.get_theme()', True),
+    ('cli', 'import sphinxify.build', True),
+    ('extension', 'import sphinxify.extension', False),
+    ]
+
+HEAVY_MODULES = ['yaml', 'urllib2', 'docutils', 'sphinx', 'jinja2']
+
+PROBE = '''
+import json, sys, time
+start = time.time()
+{code}
+elapsed = time.time() - start
+print(json.dumps([elapsed, [m for m in {heavy!r} if m in sys.modules]]))
+'''
+
+
+def measure(code, repeat):
+    best = None
+    for _ in range(repeat):
+        output = subprocess.check_output([
+            sys.executable, '-c',
+            PROBE.format(code=code, heavy=HEAVY_MODULES),
+            ])
+        elapsed, heavy = json.loads(output.decode('utf-8'))
+        best = elapsed if best is None else min(best, elapsed)
+    return best, heavy
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    failed = False
+    for name, code, light in ENTRY_POINTS:
+        elapsed, heavy = measure(code, args.repeat)
+        print('{:<10} {:7.1f}ms  {}'.format(
+            name, elapsed * 1000, ' '.join(heavy)))
+        if light and heavy:
+            print('{} imports {}'.format(name, ', '.join(heavy)))
+            failed = True
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())